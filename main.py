@@ -8,8 +8,8 @@ Aplicație GUI locală în Python/PyQt5 (în limba română), folosind PyMuPDF (
 3) Mapare "Tag XML" -> "Coloană CSV"
 4) "Salvează maparea" -> scrie mapping_config.json
 5) "Procesează -> CSV":
-   - Creează subfolder "extracted_xml/<timestamp>"
-   - Salvează atașamentele .xml acolo
+   - Extrage atașamentele .xml în memorie și le parsează direct
+   - Opțional ("Păstrează XML-urile extrase"), le salvează în subfolderul "extracted_xml/<timestamp>"
    - Generează "output_<timestamp>.csv"
    - Dacă un tag apare de mai multe ori, generăm rânduri separate (și duplicăm datele celorlalte taguri).
 
@@ -26,102 +26,262 @@ import os
 import re
 import json
 import csv
+import hashlib
 import datetime
-from typing import Set, Dict, List
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain, repeat
+from typing import BinaryIO, Set, Dict, Iterator, List, Optional, Tuple, Union
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QFileDialog, QMessageBox, QTableWidget,
-    QTableWidgetItem, QHeaderView, QAction
+    QPushButton, QLabel, QFileDialog, QMessageBox, QTableView, QCheckBox,
+    QHeaderView, QAction, QProgressBar
+)
+from PyQt5.QtCore import (
+    Qt, QObject, QRunnable, QThreadPool, QAbstractTableModel, QModelIndex, pyqtSignal
 )
-from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 
 import fitz  # PyMuPDF
 from lxml import etree
 
+# orjson e opțional (mai rapid); fallback pe json din stdlib, cu același format pe disk.
+try:
+    import orjson
+
+    def json_loads(data: bytes):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def json_loads(data: bytes):
+        return json.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+# Fiecare PDF e procesat independent => un proces per nucleu.
+MAX_WORKERS = os.cpu_count() or 1
+# 'spawn' peste tot (ca pe Windows/PyInstaller): pool-ul e pornit dintr-un thread al unui
+# proces Qt multi-thread, iar fork() dintr-un astfel de proces se poate bloca pe Linux.
+MP_CONTEXT = multiprocessing.get_context('spawn')
+# Scrierile pe disk (arhiva extracted_xml) sunt I/O => mai multe thread-uri decât nuclee.
+WRITE_WORKERS = 16
+
 
 ########################################################################
 # 0) Funcții de ajutor
 ########################################################################
 
+_SANITIZE_CHARS = '\\/:*?"<>|\r\n'
+_SANITIZE_TABLE = str.maketrans(dict.fromkeys(_SANITIZE_CHARS, '_'))
+_SANITIZE_RE = re.compile(f'[{re.escape(_SANITIZE_CHARS)}]+')
+
 def sanitize_filename(name: str) -> str:
     """Elimină caractere invalide (\\/:*?"<>|\r\n) dintr-un nume de fișier (Windows)."""
-    return re.sub(r'[\\/:*?"<>|\r\n]+', '_', name)
-
-def este_xml_in_memory(data: bytes) -> bool:
-    """Verifică dacă un buffer (bytes) reprezintă un fișier XML valid (prin lxml)."""
+    safe = name.translate(_SANITIZE_TABLE)
+    if safe == name:
+        # cazul uzual: nimic de înlocuit => doar translate (C pur, fără regex)
+        return safe
+    # secvențele de caractere invalide devin un singur '_' (ex. "a//b" -> "a_b")
+    return _SANITIZE_RE.sub('_', name)
+
+def unique_name(name: str, used: Set[str]) -> str:
+    """
+    Returnează `name` sau, dacă e deja în `used`, varianta cu sufix _2, _3... înainte de
+    extensie ("a.xml" -> "a_2.xml"). Comparația ignoră majusculele (Windows).
+    """
+    candidate = name
+    root, ext = os.path.splitext(name)
+    i = 2
+    while candidate.lower() in used:
+        candidate = f"{root}_{i}{ext}"
+        i += 1
+    used.add(candidate.lower())
+    return candidate
+
+# Entitățile interne (<!ENTITY x "...">) se rezolvă, cele externe (XXE) rămân blocate.
+# Valoarea 'internal' există doar din lxml 5; pe 4.x orice valoare nevidă ar rezolva
+# și entitățile externe => acolo le dezactivăm complet.
+RESOLVE_ENTITIES = 'internal' if etree.LXML_VERSION >= (5, 0) else False
+
+# Parser reutilizabil (unul per proces, creat la import): nu construim tabela de ID-uri
+# și nu păstrăm nodurile text doar-whitespace.
+_LXML_PARSER = etree.XMLParser(remove_blank_text=True, collect_ids=False,
+                               huge_tree=True, resolve_entities=RESOLVE_ENTITIES)
+# Pentru rânduri NU folosim remove_blank_text: un tag container (text doar whitespace)
+# trebuie să numere în continuare ca apariție => altfel s-ar schimba nr. de rânduri.
+_LXML_ROWS_PARSER = etree.XMLParser(collect_ids=False, huge_tree=True,
+                                    resolve_entities=RESOLVE_ENTITIES)
+
+# Multe PDF-uri (facturi, extrase lunare) atașează exact același XML. Rezultatele
+# parsării se rețin după hash-ul conținutului => un XML repetat nu mai e parsat.
+# Cache-urile sunt LRU mici (per proces): duplicatele apar de obicei aproape unul de
+# altul, iar memoria nu crește cu toate XML-urile unice procesate de un worker.
+HASH_CACHE_SIZE = 16
+_FIELDS_BY_HASH: "OrderedDict[bytes, Optional[Set[str]]]" = OrderedDict()
+_ROWS_BY_HASH: "OrderedDict[Tuple[bytes, Tuple[Tuple[str, str], ...]], List[Tuple[str, ...]]]" = OrderedDict()
+_MISSING = object()
+
+def content_hash(data: bytes) -> bytes:
+    """Hash rapid (BLAKE2b, 128 biți) al conținutului unui atașament."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def cache_get(cache: OrderedDict, key):
+    """Citește din cache-ul LRU (sau _MISSING) și marchează cheia ca folosită recent."""
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        cache.move_to_end(key)
+    return value
+
+def cache_put(cache: OrderedDict, key, value):
+    """Adaugă în cache-ul LRU și elimină cea mai veche intrare peste HASH_CACHE_SIZE."""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > HASH_CACHE_SIZE:
+        cache.popitem(last=False)
+
+_UTF8_BOM = b'\xef\xbb\xbf'
+_UTF16_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+def looks_like_xml(data: bytes) -> bool:
+    """
+    Test ieftin (primii octeți) dacă un buffer POATE fi XML: după BOM/whitespace
+    trebuie să înceapă cu '<'. Respinge imediat PNG, ZIP, DOCX etc. fără lxml.
+    Fals-pozitivele sunt prinse oricum de parsare.
+    """
+    if data.startswith(_UTF16_BOMS):
+        return True  # UTF-16 cu BOM => decide lxml
+    head = data[:256]
+    if head.startswith(_UTF8_BOM):
+        head = head[len(_UTF8_BOM):]
+    head = head.lstrip()
+    # '<' sau '\x00<' (UTF-16 BE fără BOM)
+    return head.startswith(b'<') or head.startswith(b'\x00<')
+
+def local_name(tag: str) -> str:
+    """Numele local al unui tag în notația Clark: '{urn:x}Amount' -> 'Amount'."""
+    return tag.rpartition('}')[2]
+
+def parse_xml_fields_in_memory(data: bytes, digest: Optional[bytes] = None) -> Optional[Set[str]]:
+    """
+    Parsează un fișier XML (din memorie) și returnează setul de tag-uri găsite
+    (nume locale, fără namespace),
+    sau None dacă buffer-ul nu e XML valid. O singură parsare servește și ca test "e XML?".
+    Un conținut văzut recent (același hash) nu mai e parsat; `digest` evită recalcularea hash-ului.
+    """
+    if not looks_like_xml(data):
+        return None
+    key = digest or content_hash(data)
+    fields = cache_get(_FIELDS_BY_HASH, key)
+    if fields is not _MISSING:
+        return fields
     try:
-        etree.fromstring(data)
-        return True
-    except:
-        return False
+        root = etree.fromstring(data, _LXML_PARSER)
+        # doar elemente (nu comentarii/PI), cu numele local: '{urn:...}Amount' -> 'Amount'
+        fields = {local_name(elem.tag) for elem in root.iter(etree.Element)}
+    except etree.XMLSyntaxError:
+        fields = None
+    cache_put(_FIELDS_BY_HASH, key, fields)
+    return fields
 
-def parse_xml_fields_in_memory(data: bytes) -> Set[str]:
+def build_rows(columns: List[List[str]], max_count: int) -> List[Tuple[str, ...]]:
     """
-    Parsează un fișier XML (din memorie) și returnează setul de tag-uri găsite.
+    Transformă coloanele (aparițiile fiecărui tag, nevide) în max_count rânduri tuple.
+    Pe rândul i, o coloană cu M apariții dă apariția min(i, M-1): coloana e prelungită
+    cu ultima ei valoare prin chain/repeat (fără copii ale listelor), iar zip()
+    construiește tuple-urile direct în C.
     """
-    fields = set()
+    extended = [chain(col, repeat(col[-1], max_count - len(col))) for col in columns]
+    return list(zip(*extended))
+
+def parse_xml_and_extract_rows(xml_file: Union[str, BinaryIO],
+                               field_mapping: Dict[str, str]) -> List[Tuple[str, ...]]:
+    """
+    Citește un fișier XML (cale pe disk sau obiect file-like binar) și returnează
+    O LISTĂ DE RÂNDURI (fiecare rând e un tuple, în ordinea coloanelor din field_mapping).
+    """
+    rows = []
+    if isinstance(xml_file, str) and not os.path.isfile(xml_file):
+        return rows
     try:
-        root = etree.fromstring(data)
-        for elem in root.iter():
-            fields.add(elem.tag)
+        root = etree.parse(xml_file, _LXML_ROWS_PARSER).getroot()
     except Exception as e:
-        print(f"EROARE parse_xml_fields_in_memory: {e}")
-    return fields
+        print(f"Eroare la parsearea {xml_file}: {e}")
+        return rows
+    return extract_rows_from_root(root, field_mapping)
 
-def parse_xml_and_extract_rows(xml_file: str, field_mapping: Dict[str, str]) -> List[Dict[str, str]]:
+def extract_rows_from_root(root, field_mapping: Dict[str, str]) -> List[Tuple[str, ...]]:
     """
-    Citește un fișier XML de pe disk și returnează O LISTĂ DE RÂNDURI (fiecare rând e un dict).
+    Generează rândurile (tuple, în ordinea coloanelor din field_mapping) dintr-un XML parsat.
     
     *Cerință*: Dacă un tag apare de N ori, generăm N rânduri și duplicăm valorile unice.
+    Tag-urile din field_mapping pot fi nume locale ('Amount') sau complete ('{urn:x}Amount').
     - Pas 1: colectăm toate aparițiile pentru fiecare tag (din field_mapping).
     - Pas 2: calculăm 'max_count' = cel mai mare număr de apariții printre tag-urile mapate.
     - Pas 3: generăm rânduri. Pe rândul i, pentru un tag care are M apariții, 
       folosim apariția min(i, M-1) (adică repetăm ultima apariție dacă i >= M).
     """
     rows = []
-    if not os.path.isfile(xml_file):
-        return rows
-
-    # 0) parse XML
-    try:
-        tree = etree.parse(xml_file)
-        root = tree.getroot()
-    except Exception as e:
-        print(f"Eroare la parsearea {xml_file}: {e}")
+    if not field_mapping:
         return rows
 
     # 1) strângem toate aparițiile: tag_occurrences[tag_xml] = [val1, val2, ...]
-    tag_occurrences = {}
-    for xml_tag, csv_header in field_mapping.items():
-        elements = root.findall('.//' + xml_tag)
-        # colectăm textul (strip). Dacă nu există, e "", etc.
-        values = []
-        for el in elements:
-            if el.text is not None:
-                values.append(el.text.strip())
-        if not values:
-            # nimic găsit => punem un singur element, ex. "" => user vrea să duplăm oricum
-            values = [""]
-        tag_occurrences[xml_tag] = values
+    tag_occurrences = {xml_tag: [] for xml_tag in field_mapping}
+    # Un tag mapat se potrivește după numele complet ('{urn:x}Amount') SAU după numele
+    # local ('Amount' => '{*}Amount', orice namespace sau niciunul), ca XML-urile cu
+    # namespace (Factur-X, UBL) să funcționeze. Filtrarea pe tag-uri o face lxml (în C),
+    # într-o singură trecere, în ordinea documentului și fără rădăcină (ca './/tag').
+    patterns = [xml_tag if xml_tag.startswith('{') else '{*}' + xml_tag
+                for xml_tag in field_mapping]
+    # Rezolvarea se face o singură dată per tag distinct: el.tag -> listele țintă.
+    targets_by_tag: Dict[str, List[List[str]]] = {}
+    for el in root.iterdescendants(patterns):
+        tag = el.tag
+        targets = targets_by_tag.get(tag)
+        if targets is None:
+            targets = [tag_occurrences[key] for key in {tag, local_name(tag)}
+                       if key in tag_occurrences]
+            targets_by_tag[tag] = targets
+        # el.text creează un str nou la fiecare acces => îl citim o singură dată;
+        # elementele fără text sunt sărite (ca înainte)
+        text = el.text
+        if text is not None:
+            text = text.strip()
+            for values in targets:
+                values.append(text)
+
+    # nimic găsit => punem un singur element, ex. "" => user vrea să duplăm oricum
+    columns = [tag_occurrences[xml_tag] or [""] for xml_tag in field_mapping]
 
     # 2) calculăm max_count
-    max_count = max(len(vals) for vals in tag_occurrences.values()) if tag_occurrences else 0
-    if max_count == 0:
-        return rows
+    max_count = max(map(len, columns))
+
+    # 3) generăm rândurile, direct ca tuple în ordinea coloanelor CSV (fără dict per rând)
+    return build_rows(columns, max_count)
 
-    # 3) generăm rândurile
-    for i in range(max_count):
-        row_data = {}
-        # inițializăm cu field_mapping values => CSV headers
-        for xml_tag, csv_header in field_mapping.items():
-            occurrences = tag_occurrences[xml_tag]
-            # index = min(i, len(occurrences)-1)
-            idx = i if i < len(occurrences) else len(occurrences)-1
-            row_data[csv_header] = occurrences[idx]
-        rows.append(row_data)
 
+def parse_xml_and_extract_rows_bytes(data: bytes, field_mapping: Dict[str, str],
+                                     digest: Optional[bytes] = None,
+                                     source_name: Optional[str] = None) -> List[Tuple[str, ...]]:
+    """
+    La fel ca parse_xml_and_extract_rows, dar direct dintr-un buffer (bytes) din memorie.
+    Un XML văzut recent (același hash, aceeași mapare) refolosește rândurile deja generate;
+    `digest` evită recalcularea hash-ului. `source_name` apare în mesajul de eroare.
+    """
+    key = (digest or content_hash(data), tuple(field_mapping.items()))
+    rows = cache_get(_ROWS_BY_HASH, key)
+    if rows is _MISSING:
+        try:
+            root = etree.fromstring(data, _LXML_ROWS_PARSER)
+        except Exception as e:
+            print(f"Eroare la parsearea {source_name or 'XML'}: {e}")
+            return []
+        rows = extract_rows_from_root(root, field_mapping)
+        cache_put(_ROWS_BY_HASH, key, rows)
     return rows
 
 
@@ -129,128 +289,321 @@ def parse_xml_and_extract_rows(xml_file: str, field_mapping: Dict[str, str]) ->
 # 1) "Descoperă câmpuri" IN-MEMORY
 ########################################################################
 
-def discover_xml_fields_in_memory(pdf_path: str) -> Set[str]:
+# Numele din API-ul PyMuPDF s-au schimbat între versiuni (camelCase -> snake_case).
+PDF_ANNOT_FILE_ATTACHMENT = getattr(fitz, 'PDF_ANNOT_FILE_ATTACHMENT', None)
+if PDF_ANNOT_FILE_ATTACHMENT is None:
+    PDF_ANNOT_FILE_ATTACHMENT = fitz.PDF_ANNOT_FILEATTACHMENT
+
+def annot_file(annot) -> Tuple[dict, bytes]:
+    """Returnează (info, bytes) pentru o adnotare FileAttachment, pe orice versiune PyMuPDF."""
+    if hasattr(annot, 'get_file'):
+        data = annot.get_file()
+        finfo = annot.file_info
+        if callable(finfo):  # versiuni în care file_info era încă metodă
+            finfo = finfo()
+    else:
+        data = annot.fileGet()
+        finfo = annot.fileInfo()
+    return finfo, data
+
+def iter_pdf_attachments(doc) -> Iterator[Tuple[str, bytes]]:
     """
-    Deschide PDF-ul, extrage atașamente (document-level + adnotări) DOAR ÎN MEMORIE,
-    parsează fiecare ca XML (dacă valid), și returnează toate tag-urile găsite (set).
+    Parcurge atașamentele unui PDF deschis (document-level + adnotări FileAttachment)
+    și produce perechi (nume_atașament, bytes).
     """
-    fields = set()
-    try:
-        doc = fitz.open(pdf_path)
-    except Exception as e:
-        print(f"Eroare la deschiderea {pdf_path}: {e}")
-        return fields
-
     # 1) Document-level attachments
     emb_count = doc.embfile_count()
     for i in range(emb_count):
         info = doc.embfile_info(i)
         attach_name = info.get("filename", f"attachment_{i}.bin")
-        data = doc.embfile_get(i)  # bytes
-
-        # test if .xml or parse directly
-        if attach_name.lower().endswith('.xml') or este_xml_in_memory(data):
-            fields_in_file = parse_xml_fields_in_memory(data)
-            fields.update(fields_in_file)
+        yield attach_name, doc.embfile_get(i)
 
-    # 2) Annotation-based attachments
+    # 2) Annotation-based attachments (paperclip)
     for page_index in range(len(doc)):
         page = doc.load_page(page_index)
-        annots = page.annots()
-        if not annots:
+        # annot_xrefs() = listă (xref, tip, ...) citită direct din /Annots, fără a
+        # încărca adnotările => paginile fără FileAttachment sunt sărite ieftin
+        if not any(entry[1] == PDF_ANNOT_FILE_ATTACHMENT for entry in page.annot_xrefs()):
             continue
 
-        for annot in annots:
-            if annot.type[0] == fitz.PDF_ANNOT_FILEATTACHMENT:
-                data = annot.file_get()
-                # check if .xml or parse
-                finfo = annot.file_info()
-                fname = finfo.get('filename', f"page{page_index}.bin")
-                if fname.lower().endswith('.xml') or este_xml_in_memory(data):
-                    fields_in_file = parse_xml_fields_in_memory(data)
-                    fields.update(fields_in_file)
+        # MuPDF filtrează singur după tip
+        for annot in page.annots(types=(PDF_ANNOT_FILE_ATTACHMENT,)):
+            finfo, data = annot_file(annot)
+            yield finfo.get('filename', f"page{page_index}.bin"), data
+
+def discover_xml_fields_in_memory(pdf_path: str) -> Tuple[Set[str], Optional[List[Tuple[str, bytes]]]]:
+    """
+    Deschide PDF-ul, extrage atașamente (document-level + adnotări) DOAR ÎN MEMORIE,
+    parsează fiecare ca XML (dacă valid), și returnează toate tag-urile găsite (set)
+    împreună cu atașamentele XML [(nume, bytes)], ca "Procesează -> CSV" să nu mai
+    redeschidă PDF-ul. Dacă PDF-ul nu poate fi deschis, lista e None (nimic de pus în cache).
+    """
+    fields = set()
+    xml_attachments = []
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"Eroare la deschiderea {pdf_path}: {e}")
+        return fields, None
+
+    for attach_name, data in iter_pdf_attachments(doc):
+        # parsăm direct: None => nu e XML (indiferent de extensie)
+        fields_in_file = parse_xml_fields_in_memory(data)
+        if fields_in_file is not None:
+            fields.update(fields_in_file)
+            xml_attachments.append((attach_name, data))
+        elif attach_name.lower().endswith('.xml'):
+            # .xml invalid: nu are tag-uri, dar la extragere se păstrează oricum
+            xml_attachments.append((attach_name, data))
 
     doc.close()
-    return fields
+    return fields, xml_attachments
 
 
 ########################################################################
 # 2) Extrage "pe disk" doar la PASUL "Procesează -> CSV"
 ########################################################################
 
-def extract_xml_attachments_to_disk(pdf_path: str, output_dir: str) -> List[str]:
+def extract_xml_attachments_to_disk(pdf_path: str, output_dir: Optional[str],
+                                    cached: Optional[List[Tuple[str, bytes]]] = None,
+                                    prefix: Optional[str] = None
+                                    ) -> List[Tuple[str, bytes, bytes]]:
     """
-    Similar cu extract_xml_attachments, dar extrage fișiere .xml pe disk.
-    Returnează calea fișierelor .xml. Folosit doar la "Procesează -> CSV".
+    Extrage atașamentele XML ale PDF-ului în memorie și returnează
+    [(nume_fișier, bytes, hash conținut)] - hash-ul e calculat o singură dată, aici.
+    Extensia .xml se decide ÎNAINTE de scriere (fără rename/remove pe disk).
+    Dacă output_dir e dat, fișierele se salvează și acolo (arhivă): fiecare scriere
+    pleacă imediat pe un thread, în timp ce extragem/validăm atașamentele următoare.
+    Dacă avem `cached` (atașamentele XML găsite la "Descoperă câmpuri"), PDF-ul nu mai e deschis.
+    Numele fișierelor sunt unice în cadrul PDF-ului (sufix _2, _3...), ca două scrieri
+    paralele să nu ajungă în același fișier; `prefix` (implicit numele PDF-ului) e ales
+    de apelant unic între PDF-uri.
+    Folosit doar la "Procesează -> CSV".
     """
-    if not os.path.exists(output_dir):
+    if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
-    doc = fitz.open(pdf_path)
-    extracted_files = []
+    xml_attachments = []
+    write_futures = []
+    safe_pdf = prefix or sanitize_filename(os.path.basename(pdf_path))
+    used_names = set()
+
+    # scrierea e I/O => thread-uri (GIL eliberat în write()); thread-urile pornesc doar la submit
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+
+        def adauga(attach_name: str, data: bytes, validat: bool = False):
+            safe_name = sanitize_filename(attach_name)
+            out_name = f"{safe_pdf}_{safe_name}"
+            nume_xml = safe_name.lower().endswith('.xml')
+            if not nume_xml and not validat and not looks_like_xml(data):
+                return  # binar evident => fără hash și fără lxml
+            digest = content_hash(data)
+            if not nume_xml:
+                # fallback: dacă e XML valid
+                if not validat and parse_xml_fields_in_memory(data, digest) is None:
+                    return
+                out_name += ".xml"
+            out_name = unique_name(out_name, used_names)
+            xml_attachments.append((out_name, data, digest))
+            if output_dir:
+                write_futures.append(executor.submit(write_file_bytes, output_dir, (out_name, data)))
+
+        if cached is not None:
+            # din cache sunt deja doar atașamente XML (validate la descoperire)
+            for attach_name, data in cached:
+                adauga(attach_name, data, validat=True)
+        else:
+            doc = fitz.open(pdf_path)
+            try:
+                for attach_name, data in iter_pdf_attachments(doc):
+                    adauga(attach_name, data)
+            finally:
+                doc.close()
+
+    # propagăm eventualele erori de scriere
+    for future in write_futures:
+        future.result()
+    return xml_attachments
+
+def write_file_bytes(output_dir: str, attachment: Tuple[str, bytes]):
+    """Scrie un atașament (nume_fișier, bytes) în output_dir."""
+    out_name, data = attachment
+    with open(os.path.join(output_dir, out_name), 'wb') as f:
+        f.write(data)
+
+def extract_rows_from_pdf(pdf_path: str, output_dir: Optional[str],
+                          field_mapping: Dict[str, str],
+                          cached: Optional[List[Tuple[str, bytes]]] = None,
+                          prefix: Optional[str] = None) -> Tuple[int, List[Tuple[str, ...]]]:
+    """
+    Worker pentru ProcessPoolExecutor: extrage XML-urile unui PDF și le parsează direct
+    din memorie (fără să le recitim de pe disk).
+    Returnează (nr. fișiere XML extrase, rândurile generate).
+    """
+    xml_attachments = extract_xml_attachments_to_disk(pdf_path, output_dir, cached, prefix)
+    rows = []
+    for out_name, data, digest in xml_attachments:
+        rows.extend(parse_xml_and_extract_rows_bytes(data, field_mapping, digest,
+                                                     f"{pdf_path}: {out_name}"))
+    return len(xml_attachments), rows
 
-    # 1) Document-level
-    emb_count = doc.embfile_count()
-    for i in range(emb_count):
-        info = doc.embfile_info(i)
-        attach_name = info.get("filename", f"attachment_{i}.bin")
-        data = doc.embfile_get(i)
 
-        safe_pdf = sanitize_filename(os.path.basename(pdf_path))
-        safe_name = sanitize_filename(attach_name)
-        out_path = os.path.join(output_dir, f"{safe_pdf}_{safe_name}")
+########################################################################
+# 3) Interfață Grafică PyQt
+########################################################################
 
-        with open(out_path, 'wb') as f:
-            f.write(data)
+# ------------------------------------
+# Joburi de fundal: PDF-urile se procesează în paralel (ProcessPoolExecutor),
+# iar pool-ul e așteptat dintr-un QRunnable (QThreadPool), ca interfața să rămână
+# responsivă. QRunnable nu e QObject => semnalele stau într-un JobSignals.
+# ------------------------------------
+class JobSignals(QObject):
+    progres = pyqtSignal(int)      # nr. PDF-uri terminate
+    rezultat = pyqtSignal(object)
+    eroare = pyqtSignal(str)
 
-        if safe_name.lower().endswith('.xml'):
-            extracted_files.append(out_path)
-        else:
-            # fallback: dacă e XML valid
-            if este_xml_in_memory(data):
-                new_xml = out_path + ".xml"
-                os.rename(out_path, new_xml)
-                extracted_files.append(new_xml)
-            else:
-                os.remove(out_path)
-
-    # 2) Annotation-based (paperclip)
-    for page_index in range(len(doc)):
-        page = doc.load_page(page_index)
-        annots = page.annots()
-        if not annots:
-            continue
 
-        for annot in annots:
-            if annot.type[0] == fitz.PDF_ANNOT_FILEATTACHMENT:
-                data = annot.file_get()
-                finfo = annot.file_info()
-                attach_name = finfo.get('filename', f"page{page_index}.bin")
-
-                safe_pdf = sanitize_filename(os.path.basename(pdf_path))
-                safe_name = sanitize_filename(attach_name)
-                out_path = os.path.join(output_dir, f"{safe_pdf}_{safe_name}")
-
-                with open(out_path, 'wb') as f:
-                    f.write(data)
-
-                if safe_name.lower().endswith('.xml'):
-                    extracted_files.append(out_path)
-                else:
-                    if este_xml_in_memory(data):
-                        new_xml = out_path + ".xml"
-                        os.rename(out_path, new_xml)
-                        extracted_files.append(new_xml)
-                    else:
-                        os.remove(out_path)
+class DiscoverJob(QRunnable):
+    """
+    Rulează discover_xml_fields_in_memory pe toate PDF-urile, în paralel.
+    rezultat: (set tag-uri, nr. PDF-uri cu XML, cache atașamente)
+    """
+    def __init__(self, pdf_paths: List[str]):
+        super().__init__()
+        self.pdf_paths = list(pdf_paths)
+        self.signals = JobSignals()
 
-    doc.close()
-    return extracted_files
+    def run(self):
+        try:
+            fields = set()
+            nr_xml_total = 0
+            attachment_cache = {}
+            workers = min(MAX_WORKERS, len(self.pdf_paths))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as executor:
+                futures = {executor.submit(discover_xml_fields_in_memory, p): p for p in self.pdf_paths}
+                for nr_gata, future in enumerate(as_completed(futures), 1):
+                    fields_in_pdf, xml_attachments = future.result()
+                    self.signals.progres.emit(nr_gata)
+                    if fields_in_pdf:
+                        nr_xml_total += 1  # PDF conține măcar 1 fișier XML
+                    fields.update(fields_in_pdf)
+                    if xml_attachments is not None:
+                        attachment_cache[futures[future]] = xml_attachments
+            self.signals.rezultat.emit((fields, nr_xml_total, attachment_cache))
+        except Exception as e:
+            self.signals.eroare.emit(f"Eroare la procesarea PDF-urilor:\n{e}")
 
 
-########################################################################
-# 3) Interfață Grafică PyQt
-########################################################################
+class ExtractJob(QRunnable):
+    """
+    Rulează extract_rows_from_pdf pe toate PDF-urile, în paralel, și scrie rândurile
+    în CSV pe măsură ce fiecare PDF e gata (nu ținem toate rândurile în memorie).
+    rezultat: (nr. fișiere XML, nr. rânduri scrise)
+    """
+    def __init__(self, pdf_paths: List[str], output_dir: Optional[str],
+                 field_mapping: Dict[str, str], csv_path: str,
+                 attachment_cache: Dict[str, List[Tuple[str, bytes]]]):
+        super().__init__()
+        self.signals = JobSignals()
+        self.pdf_paths = list(pdf_paths)
+        self.output_dir = output_dir
+        self.field_mapping = dict(field_mapping)
+        self.csv_path = csv_path
+        self.attachment_cache = attachment_cache
+
+    def run(self):
+        try:
+            f = open(self.csv_path, 'w', newline='', encoding='utf-8')
+        except Exception as e:
+            self.signals.eroare.emit(f"Nu am reușit să scriem fișierul CSV:\n{e}")
+            return
+
+        try:
+            total_rows = 0
+            total_xml_found = 0
+            with f:
+                writer = csv.writer(f)
+                writer.writerow(list(self.field_mapping.values()))
+                workers = min(MAX_WORKERS, len(self.pdf_paths))
+                with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as executor:
+                    # map păstrează ordinea PDF-urilor => rândurile CSV rămân deterministe
+                    cached = [self.attachment_cache.get(p) for p in self.pdf_paths]
+                    # PDF-uri cu același nume din foldere diferite => prefixe distincte în arhivă
+                    used_prefixes = set()
+                    prefixes = [unique_name(sanitize_filename(os.path.basename(p)), used_prefixes)
+                                for p in self.pdf_paths]
+                    results = executor.map(extract_rows_from_pdf, self.pdf_paths,
+                                           repeat(self.output_dir), repeat(self.field_mapping),
+                                           cached, prefixes)
+                    for nr_gata, (nr_xml, rows) in enumerate(results, 1):
+                        self.signals.progres.emit(nr_gata)
+                        total_xml_found += nr_xml
+                        total_rows += len(rows)
+                        writer.writerows(rows)
+            if not total_rows:
+                os.remove(self.csv_path)  # doar header => nu lăsăm un CSV gol
+            self.signals.rezultat.emit((total_xml_found, total_rows))
+        except Exception as e:
+            if os.path.exists(self.csv_path):
+                os.remove(self.csv_path)  # nu lăsăm un CSV parțial
+            self.signals.eroare.emit(f"Eroare la procesarea PDF-urilor:\n{e}")
+
+
+# ------------------------------------
+# Model pentru tabelul de mapare: două liste paralele (tag XML, coloană CSV),
+# fără câte un QTableWidgetItem per celulă.
+# ------------------------------------
+class MappingModel(QAbstractTableModel):
+    HEADERS = ["Câmp XML", "Coloană CSV"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tags: List[str] = []
+        self.csv_headers: List[str] = []
+
+    def reset(self, tags: List[str], field_mapping: Dict[str, str]):
+        # mapările vechi pot avea chei complete ('{urn:x}Amount'), iar tabelul arată
+        # numele local ('Amount') => fallback pe cheia completă cu același nume local
+        by_local_name = {}
+        for xml_tag, csv_header in field_mapping.items():
+            by_local_name.setdefault(local_name(xml_tag), csv_header)
+        self.beginResetModel()
+        self.tags = list(tags)
+        self.csv_headers = [field_mapping.get(tag) or by_local_name.get(tag, "") for tag in self.tags]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tags)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        if index.column() == 0:
+            return self.tags[index.row()]
+        return self.csv_headers[index.row()]
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or index.column() != 1 or role != Qt.EditRole:
+            return False
+        self.csv_headers[index.row()] = str(value)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        if index.column() == 1:
+            # doar coloana CSV e editabilă
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -262,6 +615,8 @@ class MainWindow(QMainWindow):
         self.xml_fields = set()       # Tag-uri descoperite
         self.field_mapping = {}       # {xml_tag: csv_header}
         self.config_file = "mapping_config.json"
+        self.job = None               # job activ în QThreadPool (discover / process)
+        self.attachment_cache = {}    # {pdf_path: [(nume, bytes XML)]} de la "Descoperă câmpuri"
 
         self.load_mapping_config()
 
@@ -287,6 +642,11 @@ class MainWindow(QMainWindow):
         self.btn_save_mapping.clicked.connect(self.save_mapping_config)
         butoane_layout.addWidget(self.btn_save_mapping)
 
+        self.chk_save_xml = QCheckBox("Păstrează XML-urile extrase")
+        self.chk_save_xml.setToolTip("Salvează și o copie a fișierelor XML în extracted_xml/<timestamp> (arhivă).")
+        self.chk_save_xml.setChecked(True)
+        butoane_layout.addWidget(self.chk_save_xml)
+
         self.btn_process_csv = QPushButton("Procesează -> CSV")
         self.btn_process_csv.clicked.connect(self.process_to_csv)
         butoane_layout.addWidget(self.btn_process_csv)
@@ -294,12 +654,16 @@ class MainWindow(QMainWindow):
         self.info_label = QLabel("Niciun fișier PDF selectat.")
         layout_principal.addWidget(self.info_label)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout_principal.addWidget(self.progress_bar)
+
         # Tabel (Câmp XML -> Coloană CSV)
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(["Câmp XML", "Coloană CSV"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        layout_principal.addWidget(self.table)
+        self.model = MappingModel(self)
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout_principal.addWidget(self.view)
 
         # Meniu
         meniu = self.menuBar()
@@ -322,6 +686,7 @@ class MainWindow(QMainWindow):
         )
         if fisiere:
             self.selected_pdf_paths = fisiere
+            self.attachment_cache = {}
             self.info_label.setText(f"{len(fisiere)} fișier(e) PDF selectate.")
 
     # ------------------------------------
@@ -336,14 +701,14 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Nicio selecție", "Selectează fișiere PDF mai întâi.")
             return
 
-        self.xml_fields.clear()
-        nr_xml_total = 0
-        for pdf_path in self.selected_pdf_paths:
-            # Obținem set de tag-uri in memory
-            fields_in_pdf = discover_xml_fields_in_memory(pdf_path)
-            if fields_in_pdf:
-                nr_xml_total += 1  # PDF conține măcar 1 fișier XML
-            self.xml_fields.update(fields_in_pdf)
+        self.job = DiscoverJob(self.selected_pdf_paths)
+        self.start_job(self.job, self.on_discover_done)
+
+    def on_discover_done(self, result):
+        fields, nr_xml_total, attachment_cache = result
+        self.set_busy(False)
+        self.xml_fields = fields
+        self.attachment_cache = attachment_cache
 
         if not self.xml_fields:
             QMessageBox.information(
@@ -361,15 +726,8 @@ class MainWindow(QMainWindow):
         self.populate_table()
 
     def populate_table(self):
-        self.table.setRowCount(len(self.xml_fields))
-        for row_idx, field in enumerate(sorted(self.xml_fields)):
-            item_field = QTableWidgetItem(field)
-            item_field.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-            self.table.setItem(row_idx, 0, item_field)
-
-            existing_csv = self.field_mapping.get(field, "")
-            item_csv = QTableWidgetItem(existing_csv)
-            self.table.setItem(row_idx, 1, item_csv)
+        # un singur reset de model (nu câte un QTableWidgetItem per celulă)
+        self.model.reset(sorted(self.xml_fields), self.field_mapping)
 
     # ------------------------------------
     # 3.3) Load / Save Mapare
@@ -377,28 +735,31 @@ class MainWindow(QMainWindow):
     def load_mapping_config(self):
         if os.path.isfile(self.config_file):
             try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    self.field_mapping = json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    self.field_mapping = json_loads(f.read())
                 print(f"Maparea încărcată din {self.config_file}")
             except Exception as e:
                 print(f"Eroare la încărcarea mapării: {e}")
 
     def save_mapping_config(self):
+        # tabelul ESTE maparea: tag-urile care nu mai apar (sau fără coloană) dispar
         new_mapping = {}
-        row_count = self.table.rowCount()
-        for r in range(row_count):
-            item_field = self.table.item(r, 0)
-            item_csv = self.table.item(r, 1)
-            if item_field and item_csv:
-                xml_tag = item_field.text().strip()
-                csv_header = item_csv.text().strip()
-                if xml_tag and csv_header:
-                    new_mapping[xml_tag] = csv_header
+        for xml_tag, csv_header in zip(self.model.tags, self.model.csv_headers):
+            xml_tag = xml_tag.strip()
+            csv_header = csv_header.strip()
+            if xml_tag and csv_header:
+                new_mapping[xml_tag] = csv_header
+        # cheile complete '{ns}tag' sunt afișate sub numele local => sunt înlocuite de rândul
+        # din tabel, cu excepția celor spre altă coloană (ex. '{urn:a}ID' și '{urn:b}ID')
+        for xml_tag, csv_header in self.field_mapping.items():
+            shown_header = new_mapping.get(local_name(xml_tag))
+            if xml_tag.startswith('{') and shown_header and csv_header != shown_header:
+                new_mapping.setdefault(xml_tag, csv_header)
 
         self.field_mapping = new_mapping
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.field_mapping, f, indent=2, ensure_ascii=False)
+            with open(self.config_file, 'wb') as f:
+                f.write(json_dumps(self.field_mapping))
             QMessageBox.information(self, "Mapare salvată", "Maparea a fost salvată cu succes!")
         except Exception as e:
             QMessageBox.critical(self, "Eroare", f"Eroare la salvarea mapării:\n{e}")
@@ -408,8 +769,9 @@ class MainWindow(QMainWindow):
     # ------------------------------------
     def process_to_csv(self):
         """
-        Creează subfolder "extracted_xml/<timestamp>", extrage acolo fișiere .xml,
-        apoi parsează fiecare => returnăm mai multe rânduri dacă avem repetări de tag.
+        Extrage fișierele .xml în memorie și le parsează direct => returnăm mai multe
+        rânduri dacă avem repetări de tag. Opțional (bifat implicit) le salvează și în
+        subfolderul "extracted_xml/<timestamp>".
         CSV final => "output_<timestamp>.csv".
         """
         if not self.selected_pdf_paths:
@@ -419,29 +781,34 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Fără mapare", "Definește și salvează măcar o mapare de câmpuri.")
             return
 
-        # 1) Creăm subfolder
+        # 1) Creăm subfolder (doar dacă păstrăm XML-urile)
         timestamp_str = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        main_extracted = os.path.join(os.getcwd(), "extracted_xml")
-        os.makedirs(main_extracted, exist_ok=True)
+        folder_extrase = None
+        if self.chk_save_xml.isChecked():
+            main_extracted = os.path.join(os.getcwd(), "extracted_xml")
+            os.makedirs(main_extracted, exist_ok=True)
 
-        folder_extrase = os.path.join(main_extracted, timestamp_str)
-        os.makedirs(folder_extrase, exist_ok=True)
+            folder_extrase = os.path.join(main_extracted, timestamp_str)
+            os.makedirs(folder_extrase, exist_ok=True)
 
         # 2) CSV => "output_<timestamp>.csv"
         csv_path = os.path.join(os.getcwd(), f"output_{timestamp_str}.csv")
 
-        # 3) Parcurgem PDF-urile, extragem XML pe disk, parse => multiple rows
-        all_rows = []
-        total_xml_found = 0
-        for pdf_path in self.selected_pdf_paths:
-            xml_files = extract_xml_attachments_to_disk(pdf_path, folder_extrase)
-            total_xml_found += len(xml_files)
-            for xfile in xml_files:
-                # parse & produce multiple row dicts
-                row_dicts = parse_xml_and_extract_rows(xfile, self.field_mapping)
-                all_rows.extend(row_dicts)
-
-        if not all_rows:
+        # 3) Parcurgem PDF-urile (în paralel), extragem XML în memorie, parse => multiple rows,
+        #    scrise în CSV pe măsură ce sunt gata
+        self.csv_path = csv_path
+        self.folder_extrase = folder_extrase
+        self.job = ExtractJob(self.selected_pdf_paths, folder_extrase, self.field_mapping,
+                              csv_path, self.attachment_cache)
+        self.start_job(self.job, self.on_process_done)
+
+    def on_process_done(self, result):
+        total_xml_found, total_rows = result
+        self.set_busy(False)
+        csv_path = self.csv_path
+        folder_extrase = self.folder_extrase
+
+        if not total_rows:
             QMessageBox.information(
                 self,
                 "Fără date",
@@ -449,28 +816,43 @@ class MainWindow(QMainWindow):
             )
             return
 
-        # 4) Scriem CSV
-        csv_headers = list(self.field_mapping.values())
-        try:
-            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=csv_headers)
-                writer.writeheader()
-                for row_data in all_rows:
-                    writer.writerow(row_data)
+        if folder_extrase:
+            mesaj_xml = f"Am extras {total_xml_found} fișier(e) XML în:\n{folder_extrase}\n\n"
+        else:
+            mesaj_xml = f"Am procesat {total_xml_found} fișier(e) XML (fără copie pe disk).\n\n"
+        QMessageBox.information(
+            self,
+            "Succes",
+            mesaj_xml +
+            f"Am generat fișierul CSV:\n{csv_path}\n\n"
+            f"Rânduri create: {total_rows}"
+        )
 
-            QMessageBox.information(
-                self,
-                "Succes",
-                f"Am extras {total_xml_found} fișier(e) XML în:\n{folder_extrase}\n\n"
-                f"Am generat fișierul CSV:\n{csv_path}\n\n"
-                f"Rânduri create: {len(all_rows)}"
-            )
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                "Eroare",
-                f"Nu am reușit să scriem fișierul CSV:\n{e}"
-            )
+    # ------------------------------------
+    # 3.5) Joburi în fundal (QThreadPool) + stare UI
+    # ------------------------------------
+    def start_job(self, job: QRunnable, on_done):
+        job.signals.progres.connect(self.progress_bar.setValue)
+        job.signals.rezultat.connect(on_done)
+        job.signals.eroare.connect(self.on_job_error)
+        self.set_busy(True)
+        QThreadPool.globalInstance().start(job)
+
+    def set_busy(self, busy: bool):
+        for btn in (self.btn_select_pdfs, self.btn_discover_fields,
+                    self.btn_save_mapping, self.chk_save_xml, self.btn_process_csv):
+            btn.setEnabled(not busy)
+        self.progress_bar.setRange(0, len(self.selected_pdf_paths))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(busy)
+        if busy:
+            self.info_label.setText(f"Se procesează {len(self.selected_pdf_paths)} fișier(e) PDF...")
+        else:
+            self.info_label.setText(f"{len(self.selected_pdf_paths)} fișier(e) PDF selectate.")
+
+    def on_job_error(self, mesaj: str):
+        self.set_busy(False)
+        QMessageBox.critical(self, "Eroare", mesaj)
 
 
 ########################################################################
@@ -484,4 +866,5 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # necesar pentru ProcessPoolExecutor în .exe (PyInstaller)
     main()